@@ -2,15 +2,18 @@ import dash
 from dash import html, dcc, Input, Output, State
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
-from multimodal_pipeline import create_story_and_images
-from utils import export_story_to_pdf
+from flask import jsonify
+from multimodal_pipeline import create_story_and_images, finalize_scenes, finalize_and_export
+from utils import session_folder
+from memory_budget import render_stats
 import os
+import uuid
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MINTY])
 app.title = "Kids Story Creator"
 
 # --------------------- Layout ---------------------
-app.layout = dbc.Container([
+main_layout = dbc.Container([
     dbc.Row([
         dbc.Col(html.H2("🧒 Kids Story Creator",
                         style={'textAlign': 'center', 'color': '#FF6F61', 'fontFamily': 'Comic Sans MS', 'marginTop': '20px'}),
@@ -69,6 +72,16 @@ app.layout = dbc.Container([
                         className="mb-3"
                     ),
 
+                    dbc.Label("Image Quality:", className="fw-bold"),
+                    dbc.RadioItems(
+                        options=[{"label": "Quick drafts", "value": "draft"},
+                                 {"label": "Full quality", "value": "final"}],
+                        value="draft",
+                        id="render_mode",
+                        inline=True,
+                        className="mb-3"
+                    ),
+
                     dbc.Button("✨ Generate Story", id="generate_btn", color="primary", className="w-100 mb-2 fw-bold"),
                     dbc.Button("📕 Export as PDF", id="pdf_btn", color="success", className="w-100 fw-bold")
                 ])
@@ -84,6 +97,9 @@ app.layout = dbc.Container([
                              style={'whiteSpace': 'pre-wrap', 'fontFamily': 'Comic Sans MS', 'fontSize': '16px'}),
                     html.Hr(),
                     html.Div(id="images_output", style={'textAlign': 'center'}),
+                    dbc.Checklist(id="keep_scenes", options=[], value=[], inline=True, className="mb-2"),
+                    dbc.Button("🖌️ Render Kept Scenes in Full Quality", id="finalize_btn", color="secondary",
+                               className="w-100 fw-bold"),
                 ])
             ])
         ], width=8)
@@ -91,10 +107,36 @@ app.layout = dbc.Container([
 ], fluid=True, style={'backgroundColor': '#FFFAE5', 'paddingBottom': '30px'})
 
 
+def serve_layout():
+    """Give every page load its own session id, which selects its outputs folder."""
+    return html.Div([dcc.Store(id="session_id", data=uuid.uuid4().hex), main_layout])
+
+
+app.layout = serve_layout
+
+
 # --------------------- Callbacks ---------------------
+def image_divs_for(image_data):
+    return [
+        html.Img(src=i["src"], style={'width': '80%', 'borderRadius': '10px', 'marginBottom': '10px'})
+        for i in image_data
+    ]
+
+
+def keep_options_for(image_data):
+    """Checklist options: drafts can be kept, finished scenes are shown but disabled."""
+    return [
+        {"label": f"Keep {i['title']}", "value": n} if i["quality"] == "draft"
+        else {"label": f"✅ {i['title']} (full quality)", "value": n, "disabled": True}
+        for n, i in enumerate(image_data, start=1)
+    ]
+
+
 @app.callback(
     [Output("story_output", "children"),
-     Output("images_output", "children")],
+     Output("images_output", "children"),
+     Output("keep_scenes", "options"),
+     Output("keep_scenes", "value")],
     Input("generate_btn", "n_clicks"),
     [State("kid_name", "value"),
      State("age_slider", "value"),
@@ -102,26 +144,58 @@ app.layout = dbc.Container([
      State("story_moral", "value"),
      State("scene_slider", "value"),
      State("story_length", "value"),
-     State("upload_photo", "contents")]
+     State("upload_photo", "contents"),
+     State("render_mode", "value"),
+     State("session_id", "data")]
 )
-def generate_story_callback(n_clicks, name, age, gender, moral, scenes, length, photo):
+def generate_story_callback(n_clicks, name, age, gender, moral, scenes, length, photo, render_mode, session_id):
     if not n_clicks: raise PreventUpdate
-    if not name: return "Please enter a name!", []
+    if not name: return "Please enter a name!", [], [], []
     print(f"Generating story for {name}, age: {age}")
-    story_text, image_data = create_story_and_images(name, age, gender, moral, scenes, length, photo)
-    image_divs = [
-        html.Img(src=i["src"], style={'width': '80%', 'borderRadius': '10px', 'marginBottom': '10px'})
-        for i in image_data
-    ]
-    return story_text, image_divs
+    draft = render_mode != "final"
+    story_text, image_data = create_story_and_images(name, age, gender, moral, scenes, length, photo, draft=draft,
+                                                     output_folder=session_folder(session_id))
+    keep_options = keep_options_for(image_data) if draft else []
+    return story_text, image_divs_for(image_data), keep_options, []
+
+
+@app.callback(
+    [Output("images_output", "children", allow_duplicate=True),
+     Output("keep_scenes", "options", allow_duplicate=True),
+     Output("keep_scenes", "value", allow_duplicate=True)],
+    Input("finalize_btn", "n_clicks"),
+    [State("keep_scenes", "value"),
+     State("session_id", "data")],
+    prevent_initial_call=True
+)
+def finalize_scenes_callback(n_clicks, kept_scenes, session_id):
+    if not n_clicks or not kept_scenes: raise PreventUpdate
+    image_data = finalize_scenes(kept_scenes, session_folder(session_id))
+    return image_divs_for(image_data), keep_options_for(image_data), []
+
+
+@app.callback(
+    Output("finalize_btn", "style"),
+    Input("render_mode", "value")
+)
+def toggle_finalize_button(render_mode):
+    return {'display': 'none'} if render_mode == "final" else {}
 
 
 @app.callback(
     Output("pdf_status", "children"),
     Input("pdf_btn", "n_clicks"),
     [State("story_output", "children"),
-     State("scene_slider", "value")]
+     State("scene_slider", "value"),
+     State("session_id", "data")]
 )
-def export_pdf_callback(n_clicks, story_text, scene_count):
+def export_pdf_callback(n_clicks, story_text, scene_count, session_id):
     if not n_clicks: raise PreventUpdate
-    return export_story_to_pdf(story_text, scene_count)
+    return finalize_and_export(story_text, scene_count, session_folder(session_id))
+
+
+# --------------------- Diagnostics ---------------------
+@app.server.route("/render-stats")
+def render_stats_route():
+    """Peak memory and latency of recent renders, read by load_test.py."""
+    return jsonify(render_stats())
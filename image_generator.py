@@ -1,21 +1,56 @@
 import os
+import random
 from diffusers import StableDiffusionImg2ImgPipeline, StableDiffusionPipeline
 from PIL import Image
 import torch
+from stub_backends import USE_STUB_BACKENDS, StubDiffusionPipeline
+from memory_budget import RENDER_LOCK, choose_memory_tier, apply_memory_tier, track_peak_memory, record_render
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-# Load text-to-image model
-sd_model = StableDiffusionPipeline.from_pretrained(
-    "runwayml/stable-diffusion-v1-5",
-    torch_dtype=torch.float16 if device == "cuda" else torch.float32
-).to(device)
+dtype = torch.float16 if device == "cuda" else torch.float32
 
-# Load image-to-image model for character reference
-img2img_model = StableDiffusionImg2ImgPipeline.from_pretrained(
-    "runwayml/stable-diffusion-v1-5",
-    torch_dtype=torch.float16 if device == "cuda" else torch.float32
-).to(device)
+# Draft renders are small and few-step; refining a kept draft runs img2img over
+# REFINE_STRENGTH of FINAL_STEPS at full size.
+DRAFT_SIZE = int(os.environ.get("DRAFT_IMAGE_SIZE", "256"))
+DRAFT_STEPS = int(os.environ.get("DRAFT_STEPS", "15"))
+FINAL_SIZE = 512
+FINAL_STEPS = int(os.environ.get("FINAL_STEPS", "50"))
+REFINE_STRENGTH = float(os.environ.get("REFINE_STRENGTH", "0.55"))
+
+if USE_STUB_BACKENDS:
+    print("🧪 Using stub diffusion backend (no models loaded)")
+    sd_model = StubDiffusionPipeline()
+    img2img_model = StubDiffusionPipeline()
+else:
+    # Load text-to-image model
+    sd_model = StableDiffusionPipeline.from_pretrained(
+        "runwayml/stable-diffusion-v1-5",
+        torch_dtype=dtype
+    ).to(device)
+
+    # Image-to-image model for character reference shares the same weights
+    # instead of keeping a second copy resident; only the scheduler is its own.
+    img2img_model = StableDiffusionImg2ImgPipeline(**{
+        **sd_model.components,
+        "scheduler": sd_model.scheduler.from_config(sd_model.scheduler.config),
+    })
+
+
+def configure_for_memory_budget(at_startup=False, size=FINAL_SIZE):
+    """
+    Measure free memory and switch both pipelines to the fastest tier that fits the budget
+    for a size x size render. Call with RENDER_LOCK held and keep holding it for the render.
+    """
+    tier = choose_memory_tier(device, dtype, at_startup=at_startup, pixels=size * size)
+    for pipe in (sd_model, img2img_model):
+        apply_memory_tier(pipe, tier, size=size)
+    return tier
+
+
+with RENDER_LOCK:
+    startup_tier = configure_for_memory_budget(at_startup=True)
+print(f"🧠 Image pipelines configured for memory tier '{startup_tier['name']}' on {device}")
 
 from PIL import Image
 import os
@@ -39,12 +74,16 @@ def generate_scene_with_character(scene_desc, age, gender, character_image, outp
         "in storybook cartoon form"
     )
 
-    result = img2img_model(
-        prompt=ref_prompt,
-        image=init_image,
-        strength=0.6,          # keeps resemblance but stylizes cartoon
-        guidance_scale=8.0,
-    )
+    with RENDER_LOCK:
+        tier = configure_for_memory_budget()
+        with track_peak_memory(device) as stats:
+            result = img2img_model(
+                prompt=ref_prompt,
+                image=init_image,
+                strength=0.6,          # keeps resemblance but stylizes cartoon
+                guidance_scale=8.0,
+            )
+        record_render("Character scene", tier, stats, dtype, FINAL_SIZE * FINAL_SIZE)
     final_image = result.images[0]
 
     # Ensure output folder exists
@@ -55,19 +94,41 @@ def generate_scene_with_character(scene_desc, age, gender, character_image, outp
     return img_path
 
 
-def generate_scene(scene_desc, age, gender, scene_index=1, output_folder="outputs"):
-    """
-    Generate a cartoon story scene without any uploaded character.
-    Saves the final image as scene_<index>.png and returns the path.
-    """
-    base_prompt = (
+def scene_prompt(scene_desc, age, gender):
+    """Prompt shared by the draft and full-quality renders of a scene."""
+    return (
         f"A magical {scene_desc}, featuring a {age}-year-old {gender} child, "
         "storybook cartoon illustration, light pastel colors, soft lines, "
         "whimsical, hand-drawn style, cheerful, background in subtle watercolor comic style"
     )
 
-    print(f"🌀 Generating scene {scene_index} without character photo...")
-    result = sd_model(prompt=base_prompt, guidance_scale=7.5)
+
+def generate_scene(scene_desc, age, gender, scene_index=1, output_folder="outputs", draft=False, seed=None):
+    """
+    Generate a cartoon story scene without any uploaded character.
+    With draft=True renders quickly at DRAFT_SIZE with DRAFT_STEPS; refine_scene
+    later turns the draft into the full-quality image. Without a seed a random one is
+    used, so regenerating gives a new picture; pass the same seed to refine_scene.
+    Saves the image as scene_<index>.png and returns the path.
+    """
+    base_prompt = scene_prompt(scene_desc, age, gender)
+    if seed is None:
+        seed = random.randrange(2**32)
+    size, steps = (DRAFT_SIZE, DRAFT_STEPS) if draft else (FINAL_SIZE, FINAL_STEPS)
+
+    print(f"🌀 Generating {'draft ' if draft else ''}scene {scene_index} without character photo...")
+    with RENDER_LOCK:
+        tier = configure_for_memory_budget(size=size)
+        with track_peak_memory(device) as stats:
+            result = sd_model(
+                prompt=base_prompt,
+                guidance_scale=7.5,
+                height=size,
+                width=size,
+                num_inference_steps=steps,
+                generator=torch.Generator(device="cpu").manual_seed(seed),
+            )
+        record_render(f"Scene {scene_index}{' draft' if draft else ''}", tier, stats, dtype, size * size)
     final_image = result.images[0]
 
     # Ensure output folder exists
@@ -76,3 +137,35 @@ def generate_scene(scene_desc, age, gender, scene_index=1, output_folder="output
     final_image.save(img_path)
     print(f"✅ Scene {scene_index} saved: {img_path}")
     return img_path
+
+
+def refine_scene(scene_desc, age, gender, scene_index, seed, output_folder="outputs"):
+    """
+    Re-render a draft scene at full quality. The upscaled draft goes through img2img
+    with the same prompt and seed, so the composition is kept and only
+    REFINE_STRENGTH of the FINAL_STEPS denoising steps are run.
+    Overwrites scene_<index>.png and returns the path.
+    """
+    img_path = os.path.join(output_folder, f"scene_{scene_index}.png")
+    if not os.path.exists(img_path):
+        return generate_scene(scene_desc, age, gender, scene_index, output_folder, seed=seed)
+
+    draft_image = Image.open(img_path).convert("RGB").resize((FINAL_SIZE, FINAL_SIZE), Image.LANCZOS)
+
+    print(f"🖌️ Refining scene {scene_index} to full quality...")
+    with RENDER_LOCK:
+        tier = configure_for_memory_budget()
+        with track_peak_memory(device) as stats:
+            result = img2img_model(
+                prompt=scene_prompt(scene_desc, age, gender),
+                image=draft_image,
+                strength=REFINE_STRENGTH,
+                guidance_scale=7.5,
+                num_inference_steps=FINAL_STEPS,
+                generator=torch.Generator(device="cpu").manual_seed(seed),
+            )
+        record_render(f"Scene {scene_index} refine", tier, stats, dtype, FINAL_SIZE * FINAL_SIZE)
+
+    result.images[0].save(img_path)
+    print(f"✅ Scene {scene_index} refined: {img_path}")
+    return img_path
@@ -0,0 +1,336 @@
+"""
+Load-testing harness for the Kids Story Creator Dash app.
+
+Simulates many families at once by driving /_dash-update-component for
+generate_story_callback and export_pdf_callback, then reports throughput,
+latency percentiles, error rates, server RSS over time and the server's
+per-render working memory and latency by memory tier.
+
+Example (starts the app itself with stub LLM and diffusion backends):
+
+    python load_test.py --launch --sessions 20 --iterations 3 \
+        --llm-latency 1.5 --diffusion-latency 4 --output run.json
+
+Compare against an earlier run with --baseline run.json.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+GENERATE = "generate_story_callback"
+EXPORT_PDF = "export_pdf_callback"
+
+
+# --------------------- Dash payloads ---------------------
+def generate_payload(n_clicks, name, scenes, render_mode, session_id):
+    """Request body Dash sends when the Generate Story button is clicked."""
+    return {
+        "output": "..story_output.children...images_output.children..."
+                  "keep_scenes.options...keep_scenes.value..",
+        "outputs": [{"id": "story_output", "property": "children"},
+                    {"id": "images_output", "property": "children"},
+                    {"id": "keep_scenes", "property": "options"},
+                    {"id": "keep_scenes", "property": "value"}],
+        "inputs": [{"id": "generate_btn", "property": "n_clicks", "value": n_clicks}],
+        "changedPropIds": ["generate_btn.n_clicks"],
+        "state": [
+            {"id": "kid_name", "property": "value", "value": name},
+            {"id": "age_slider", "property": "value", "value": 6},
+            {"id": "gender_select", "property": "value", "value": "girl"},
+            {"id": "story_moral", "property": "value", "value": "Friendship"},
+            {"id": "scene_slider", "property": "value", "value": scenes},
+            {"id": "story_length", "property": "value", "value": "short"},
+            {"id": "upload_photo", "property": "contents", "value": None},
+            {"id": "render_mode", "property": "value", "value": render_mode},
+            {"id": "session_id", "property": "data", "value": session_id},
+        ],
+    }
+
+
+def export_pdf_payload(n_clicks, story_text, scenes, session_id):
+    """Request body Dash sends when the Export as PDF button is clicked."""
+    return {
+        "output": "pdf_status.children",
+        "outputs": {"id": "pdf_status", "property": "children"},
+        "inputs": [{"id": "pdf_btn", "property": "n_clicks", "value": n_clicks}],
+        "changedPropIds": ["pdf_btn.n_clicks"],
+        "state": [
+            {"id": "story_output", "property": "children", "value": story_text},
+            {"id": "scene_slider", "property": "value", "value": scenes},
+            {"id": "session_id", "property": "data", "value": session_id},
+        ],
+    }
+
+
+# --------------------- Server ---------------------
+def launch_server(port, llm_latency, diffusion_latency, workdir):
+    """
+    Start the app with stub backends in a child process and return it. The server runs
+    in workdir, so the images and PDFs it writes to outputs/ stay out of the repo.
+    """
+    repo_root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ,
+               KIDS_STORY_STUB_BACKENDS="1",
+               STUB_LLM_LATENCY=str(llm_latency),
+               STUB_DIFFUSION_LATENCY=str(diffusion_latency),
+               PYTHONPATH=os.pathsep.join(filter(None, [repo_root, os.environ.get("PYTHONPATH")])))
+    code = f"from app import app; app.run_server(debug=False, port={port})"
+    return subprocess.Popen([sys.executable, "-c", code], env=env, cwd=workdir)
+
+
+def wait_for_server(url, server=None, timeout=60):
+    """Poll until the app answers; fail fast if a launched server process has exited."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server process exited with code {server.returncode} before coming up")
+        try:
+            if requests.get(url, timeout=2).ok:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout}s")
+
+
+def read_rss_mb(pid):
+    """Resident set size of a process in MB, read from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def sample_rss(pid, interval, samples, stop_event, start_time):
+    while not stop_event.is_set():
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            samples.append({"t": round(time.time() - start_time, 2), "rss_mb": round(rss, 1)})
+        stop_event.wait(interval)
+
+
+# --------------------- Sessions ---------------------
+def post_callback(http, endpoint, callback, payload, timeout, results, lock):
+    """POST one callback request, record its latency and return the parsed response (or None)."""
+    start = time.time()
+    body = None
+    try:
+        resp = http.post(endpoint, json=payload, timeout=timeout)
+        if resp.status_code == 200:
+            body = resp.json()
+        else:
+            print(f"⚠️ {callback} returned HTTP {resp.status_code}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"⚠️ {callback} failed: {e}")
+    with lock:
+        results.append({"callback": callback, "start": start,
+                        "latency": time.time() - start, "ok": body is not None})
+    return body
+
+
+def run_session(session_id, url, iterations, scenes, render_mode, timeout, results, lock):
+    """One simulated family: generate a story, then export it, `iterations` times."""
+    endpoint = url.rstrip("/") + "/_dash-update-component"
+    http = requests.Session()
+    name = f"Kid{session_id}"
+    browser_session = uuid.uuid4().hex  # what the app's per-page-load session_id store holds
+
+    for n_clicks in range(1, iterations + 1):
+        body = post_callback(http, endpoint, GENERATE,
+                             generate_payload(n_clicks, name, scenes, render_mode, browser_session),
+                             timeout, results, lock)
+        if body is None:
+            continue
+        story_text = body.get("response", {}).get("story_output", {}).get("children", "")
+        post_callback(http, endpoint, EXPORT_PDF,
+                      export_pdf_payload(n_clicks, story_text, scenes, browser_session),
+                      timeout, results, lock)
+
+
+def fetch_render_stats(url):
+    """Per-render peak memory and latency recorded by the server, or [] if unavailable."""
+    try:
+        resp = requests.get(url.rstrip("/") + "/render-stats", timeout=10)
+        if resp.ok:
+            return resp.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"⚠️ Could not fetch render stats: {e}")
+    return []
+
+
+# --------------------- Report ---------------------
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(results, wall_time, rss_samples, config, renders=(), failed_sessions=0):
+    report = {"config": config, "wall_time_s": round(wall_time, 2), "failed_sessions": failed_sessions,
+              "callbacks": {}}
+    for callback in (GENERATE, EXPORT_PDF):
+        rows = [r for r in results if r["callback"] == callback]
+        latencies = [r["latency"] for r in rows if r["ok"]]
+        errors = sum(1 for r in rows if not r["ok"])
+        report["callbacks"][callback] = {
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+            "throughput_rps": round(len(latencies) / wall_time, 3) if wall_time else 0.0,
+            **{f"p{p}_s": round(percentile(latencies, p), 3) if latencies else None
+               for p in (50, 90, 95, 99)},
+            "max_s": round(max(latencies), 3) if latencies else None,
+        }
+    completed = sum(1 for r in results if r["ok"])
+    report["total_throughput_rps"] = round(completed / wall_time, 3) if wall_time else 0.0
+    report["rss"] = {
+        "peak_mb": max((s["rss_mb"] for s in rss_samples), default=None),
+        "final_mb": rss_samples[-1]["rss_mb"] if rss_samples else None,
+        "samples": rss_samples,
+    }
+    report["renders"] = {}
+    for tier in sorted({r["tier"] for r in renders}):
+        rows = [r for r in renders if r["tier"] == tier]
+        report["renders"][tier] = {
+            "renders": len(rows),
+            "mean_working_mb": round(sum(r["working_mb"] for r in rows) / len(rows), 1),
+            "max_working_mb": max(r["working_mb"] for r in rows),
+            "mean_seconds": round(sum(r["seconds"] for r in rows) / len(rows), 2),
+        }
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"\n📊 Load test: {report['config']['sessions']} sessions, "
+          f"{report['wall_time_s']}s wall time, {report['total_throughput_rps']} req/s overall")
+    if report["failed_sessions"]:
+        print(f"  ⚠️ {report['failed_sessions']} sessions crashed; their remaining requests were never sent")
+    for callback, stats in report["callbacks"].items():
+        if stats["p50_s"] is None:
+            print(f"  {callback}: {stats['requests']} requests, none succeeded")
+            continue
+        line = (f"  {callback}: {stats['requests']} requests, error rate {stats['error_rate']:.1%}, "
+                f"{stats['throughput_rps']} req/s, p50 {stats['p50_s']}s, p95 {stats['p95_s']}s, "
+                f"p99 {stats['p99_s']}s")
+        if baseline and callback in baseline["callbacks"]:
+            old = baseline["callbacks"][callback]
+            if old["p95_s"] and stats["p95_s"]:
+                line += f" (p95 {stats['p95_s'] - old['p95_s']:+.3f}s vs baseline)"
+        print(line)
+    rss = report["rss"]
+    if rss["samples"]:
+        print(f"  server RSS: peak {rss['peak_mb']} MB, final {rss['final_mb']} MB "
+              f"({len(rss['samples'])} samples)")
+        if baseline and baseline["rss"]["peak_mb"]:
+            print(f"  peak RSS {rss['peak_mb'] - baseline['rss']['peak_mb']:+.1f} MB vs baseline")
+    else:
+        print("  server RSS: not sampled (use --launch or --server-pid on Linux)")
+    for tier, stats in report.get("renders", {}).items():
+        print(f"  renders in tier '{tier}': {stats['renders']}, working memory mean "
+              f"{stats['mean_working_mb']} MB / max {stats['max_working_mb']} MB, "
+              f"mean {stats['mean_seconds']}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-user load test for the Kids Story Creator app")
+    parser.add_argument("--url", default="http://127.0.0.1:8050", help="Base URL of a running app")
+    parser.add_argument("--launch", action="store_true",
+                        help="Start the app with stub backends instead of using a running one")
+    parser.add_argument("--port", type=int, default=8050, help="Port for --launch")
+    parser.add_argument("--server-pid", type=int, help="PID of an already running server, for RSS sampling")
+    parser.add_argument("--sessions", type=int, default=10, help="Number of simultaneous simulated families")
+    parser.add_argument("--iterations", type=int, default=2, help="Generate + export cycles per session")
+    parser.add_argument("--scenes", type=int, default=2, help="Scenes requested per story")
+    parser.add_argument("--render-mode", choices=["draft", "final"], default="draft",
+                        help="Image quality chosen when generating")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which sessions are started")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-request timeout in seconds")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Stub LLM latency (with --launch)")
+    parser.add_argument("--diffusion-latency", type=float, default=5.0,
+                        help="Stub diffusion latency per image (with --launch)")
+    parser.add_argument("--rss-interval", type=float, default=1.0, help="Seconds between RSS samples")
+    parser.add_argument("--output", help="Write the full report as JSON to this path")
+    parser.add_argument("--baseline", help="JSON report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    server = workdir = None
+    url, pid = args.url, args.server_pid
+    if args.launch:
+        url = f"http://127.0.0.1:{args.port}"
+        workdir = tempfile.TemporaryDirectory(prefix="kids_story_load_test_")
+        server = launch_server(args.port, args.llm_latency, args.diffusion_latency, workdir.name)
+        pid = server.pid
+
+    try:
+        wait_for_server(url, server)
+        results, rss_samples = [], []
+        lock, stop_event = threading.Lock(), threading.Event()
+        start_time = time.time()
+
+        sampler = None
+        if pid:
+            sampler = threading.Thread(target=sample_rss, daemon=True,
+                                       args=(pid, args.rss_interval, rss_samples, stop_event, start_time))
+            sampler.start()
+
+        print(f"🚀 Starting {args.sessions} sessions against {url}")
+        futures = []
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            for i in range(args.sessions):
+                futures.append(pool.submit(run_session, i + 1, url, args.iterations, args.scenes,
+                                           args.render_mode, args.timeout, results, lock))
+                if args.ramp_up and args.sessions > 1:
+                    time.sleep(args.ramp_up / (args.sessions - 1))
+        wall_time = time.time() - start_time
+
+        failed_sessions = 0
+        for i, future in enumerate(futures, start=1):
+            try:
+                future.result()
+            except Exception as e:
+                failed_sessions += 1
+                print(f"⚠️ Session {i} crashed: {e!r}")
+
+        stop_event.set()
+        if sampler:
+            sampler.join()
+        renders = fetch_render_stats(url)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        if workdir:
+            workdir.cleanup()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+    report = summarize(results, wall_time, rss_samples, config, renders, failed_sessions)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
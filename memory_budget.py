@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import psutil
+import torch
+
+# Total memory (MB) image generation may use, weights included; 0 means no fixed budget,
+# only what the machine currently has available.
+MEMORY_BUDGET_MB = float(os.environ.get("IMAGE_MEMORY_BUDGET_MB", "0"))
+# Memory (MB) left free for the rest of the app and the OS.
+MEMORY_HEADROOM_MB = float(os.environ.get("IMAGE_MEMORY_HEADROOM_MB", "512"))
+# Sequential CPU offload cannot be undone, so outside startup it is only enabled after
+# this many renders in a row found too little memory for any other tier.
+OFFLOAD_AFTER_LOW_READINGS = int(os.environ.get("OFFLOAD_AFTER_LOW_READINGS", "3"))
+
+# Pipeline configurations from fastest to most memory-frugal. estimate_mb is the working
+# memory (peak minus memory at start) of one float32 512x512 render on top of the weights.
+# These defaults are starting points only and have not been measured on our nodes; every
+# render's measured working_mb replaces them (see measured_estimate_mb), so after one
+# render per tier choose_memory_tier works from /render-stats numbers, not guesses.
+#
+# VAE slicing and tiling are not tiers of their own: slicing only splits batches larger
+# than one image and SD 1.5 only tiles latents wider than 64 (renders above 512x512),
+# so apply_memory_tier turns them on in the frugal tiers only when a render needs them.
+MEMORY_TIERS = [
+    {"name": "full", "estimate_mb": 3500, "attention_slicing": False, "cpu_offload": False},
+    {"name": "sliced", "estimate_mb": 1800, "attention_slicing": True, "cpu_offload": False},
+    {"name": "offload", "estimate_mb": 600, "attention_slicing": True, "cpu_offload": True},
+]
+VAE_TILE_MIN_SIZE = 512
+
+# The pipelines share one UNet and VAE, so choosing a tier and rendering with it must not
+# overlap with another render. Hold this lock around both.
+RENDER_LOCK = threading.Lock()
+
+# Peak memory and latency of the most recent renders, newest last. Read via render_stats().
+RENDER_STATS = deque(maxlen=100)
+_render_stats_lock = threading.Lock()
+_low_readings = 0
+_offload_chosen = False
+# Largest measured working memory per tier, normalized to a float32 512x512 render.
+_measured_mb = {}
+
+
+def used_memory_mb(device):
+    """Memory currently held by image generation: CUDA allocations or this process's RSS."""
+    if device == "cuda":
+        return torch.cuda.memory_allocated() / 2**20
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def available_memory_mb(device):
+    """Memory that could still be allocated on the device right now."""
+    if device == "cuda":
+        free, _ = torch.cuda.mem_get_info()
+        return free / 2**20
+    return psutil.virtual_memory().available / 2**20
+
+
+def choose_memory_tier(device, dtype=torch.float32, at_startup=False, pixels=512 * 512):
+    """
+    Pick the fastest tier whose estimated working memory, scaled to a render of the
+    given pixel count, fits in what is available, capped by MEMORY_BUDGET_MB. When
+    nothing fits, the offload tier is only chosen at startup or after
+    OFFLOAD_AFTER_LOW_READINGS low readings in a row, so a short dip does not switch
+    it on for good. Call with RENDER_LOCK held.
+    """
+    global _low_readings, _offload_chosen
+    free_mb = available_memory_mb(device) - MEMORY_HEADROOM_MB
+    if MEMORY_BUDGET_MB:
+        free_mb = min(free_mb, MEMORY_BUDGET_MB - used_memory_mb(device))
+
+    # Offloading only helps when there is a GPU to offload from.
+    tiers = [t for t in MEMORY_TIERS if device == "cuda" or not t["cpu_offload"]]
+    if _offload_chosen:
+        return tiers[-1]
+    scale = render_scale(dtype, pixels)
+    for tier in tiers:
+        if tier["cpu_offload"]:
+            break
+        if measured_estimate_mb(tier) * scale <= free_mb:
+            _low_readings = 0
+            return tier
+
+    _low_readings += 1
+    if tiers[-1]["cpu_offload"] and (at_startup or _low_readings >= OFFLOAD_AFTER_LOW_READINGS):
+        tier = tiers[-1]
+        _offload_chosen = True
+    else:
+        tier = [t for t in tiers if not t["cpu_offload"]][-1]
+    if measured_estimate_mb(tier) * scale > free_mb:
+        print(f"⚠️ Only {free_mb:.0f} MB free for image generation, "
+              f"below the {measured_estimate_mb(tier) * scale:.0f} MB the '{tier['name']}' tier needs")
+    return tier
+
+
+def render_scale(dtype, pixels):
+    """How a render compares to the float32 512x512 render the estimates are for."""
+    return (0.5 if dtype == torch.float16 else 1.0) * pixels / (512 * 512)
+
+
+def measured_estimate_mb(tier):
+    """Largest working memory measured for the tier so far, or its default estimate."""
+    return _measured_mb.get(tier["name"], tier["estimate_mb"])
+
+
+def apply_memory_tier(pipe, tier, size=512, batch_size=1):
+    """
+    Switch a diffusers pipeline's memory options to match the tier for a size x size
+    render of batch_size images. Sequential CPU offload cannot be undone in place, so
+    once enabled it stays on.
+    """
+    frugal = tier["attention_slicing"]
+    if not hasattr(pipe, "enable_attention_slicing"):
+        return  # stub pipeline, nothing to configure
+
+    if tier["attention_slicing"]:
+        pipe.enable_attention_slicing()
+    else:
+        pipe.disable_attention_slicing()
+
+    if frugal and batch_size > 1:
+        pipe.enable_vae_slicing()
+    else:
+        pipe.disable_vae_slicing()
+
+    if frugal and size > VAE_TILE_MIN_SIZE:
+        pipe.enable_vae_tiling()
+    else:
+        pipe.disable_vae_tiling()
+
+    if tier["cpu_offload"] and not getattr(pipe, "_sequential_offload_enabled", False):
+        pipe.enable_sequential_cpu_offload()
+        pipe._sequential_offload_enabled = True
+
+
+@contextmanager
+def track_peak_memory(device):
+    """
+    Measure peak memory and wall time of the enclosed render. peak_mb is the process-wide
+    high-water mark (weights included); working_mb is the peak minus the memory in use
+    when the render started, i.e. what the render itself needed. The CUDA peak counter
+    and the CPU process RSS are both process-wide, so the result is only per render when
+    renders are serialized: call with RENDER_LOCK held. On CPU the RSS still includes
+    whatever the rest of the app allocates meanwhile.
+    """
+    stats = {}
+    start = time.time()
+    if device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+        start_mb = torch.cuda.memory_allocated() / 2**20
+        try:
+            yield stats
+        finally:
+            stats["peak_mb"] = torch.cuda.max_memory_allocated() / 2**20
+            stats["working_mb"] = max(stats["peak_mb"] - start_mb, 0.0)
+            stats["seconds"] = time.time() - start
+        return
+
+    process = psutil.Process()
+    start_rss = process.memory_info().rss
+    peak = [start_rss]
+    stop_event = threading.Event()
+
+    def sample():
+        while not stop_event.wait(0.05):
+            peak[0] = max(peak[0], process.memory_info().rss)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield stats
+    finally:
+        stop_event.set()
+        sampler.join()
+        stats["peak_mb"] = max(peak[0], process.memory_info().rss) / 2**20
+        stats["working_mb"] = max(stats["peak_mb"] - start_rss / 2**20, 0.0)
+        stats["seconds"] = time.time() - start
+
+
+def record_render(label, tier, stats, dtype=torch.float32, pixels=512 * 512):
+    """
+    Keep and log the memory/latency trade-off of one render, and feed its working
+    memory back into the tier's estimate. Call with RENDER_LOCK held.
+    """
+    entry = {"label": label, "tier": tier["name"], "working_mb": round(stats["working_mb"], 1),
+             "peak_mb": round(stats["peak_mb"], 1), "seconds": round(stats["seconds"], 2)}
+    with _render_stats_lock:
+        RENDER_STATS.append(entry)
+
+    normalized_mb = stats["working_mb"] / render_scale(dtype, pixels)
+    if normalized_mb > 0:
+        _measured_mb[tier["name"]] = max(_measured_mb.get(tier["name"], 0.0), normalized_mb)
+
+    print(f"📏 {label}: tier '{entry['tier']}', working {entry['working_mb']} MB "
+          f"(process peak {entry['peak_mb']} MB), {entry['seconds']}s")
+    return entry
+
+
+def render_stats():
+    """Copy of the recorded renders, safe to read while other threads add to it."""
+    with _render_stats_lock:
+        return list(RENDER_STATS)
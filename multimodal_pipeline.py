@@ -1,11 +1,89 @@
 from story_generator import generate_story_from_llama3
-from image_generator import generate_scene_with_character, generate_scene
-from utils import display_image, prepare_output_folder
+from image_generator import generate_scene_with_character, generate_scene, refine_scene
+from utils import (display_image, prepare_output_folder, save_scene_manifest, load_scene_manifest,
+                   export_story_to_pdf, is_session_folder)
+from contextlib import contextmanager
 from PIL import Image
-import io, base64
+import io, base64, os, random, shutil, threading, time
 
-def create_story_and_images(name, age, gender, moral, scenes_count, length, photo_contents=None):
-    prepare_output_folder()
+# Session folders (and their locks) untouched for this long are deleted.
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", str(6 * 60 * 60)))
+CLEANUP_INTERVAL_SECONDS = 60
+
+# One lock per output folder: generating, refining and exporting the same session's
+# scenes must not overlap, or scenes get refined twice, manifest writes are lost and
+# the PDF mixes old and new scenes. "users" counts threads holding or waiting for the
+# lock, so cleanup never drops an entry someone is about to use.
+_sessions = {}
+_sessions_guard = threading.Lock()
+_last_cleanup = 0.0
+
+
+@contextmanager
+def folder_lock(output_folder):
+    with _sessions_guard:
+        session = _sessions.setdefault(output_folder, {"lock": threading.Lock(), "users": 0, "last_used": 0.0})
+        session["users"] += 1
+    try:
+        with session["lock"]:
+            yield
+    finally:
+        with _sessions_guard:
+            session["users"] -= 1
+            session["last_used"] = time.time()
+
+
+def cleanup_idle_sessions(base_folder="outputs"):
+    """
+    Delete per-session folders under base_folder, and their lock entries, that have not
+    been used for SESSION_TTL_SECONDS. Folders from before a restart are aged by their
+    modification time. Runs at most once per CLEANUP_INTERVAL_SECONDS.
+    """
+    global _last_cleanup
+    now = time.time()
+    with _sessions_guard:
+        if now - _last_cleanup < CLEANUP_INTERVAL_SECONDS:
+            return
+        _last_cleanup = now
+
+        folders = {}
+        if os.path.isdir(base_folder):
+            for name in os.listdir(base_folder):
+                path = os.path.join(base_folder, name)
+                if os.path.isdir(path) and is_session_folder(path):
+                    folders[path] = os.path.getmtime(path)
+        for path, session in _sessions.items():
+            if is_session_folder(path):
+                folders[path] = max(folders.get(path, 0.0), session["last_used"])
+
+        for path, last_used in folders.items():
+            session = _sessions.get(path)
+            if now - last_used < SESSION_TTL_SECONDS or (session and session["users"]):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            _sessions.pop(path, None)
+            print(f"🧹 Removed idle session folder: {path}")
+
+
+def scene_image_data(manifest, output_folder):
+    """Display data for every scene in the manifest."""
+    return [
+        {"src": display_image(os.path.join(output_folder, f"scene_{sc['index']}.png")),
+         "title": sc["title"], "quality": sc["quality"]}
+        for sc in manifest
+    ]
+
+
+def create_story_and_images(name, age, gender, moral, scenes_count, length, photo_contents=None, draft=True,
+                            output_folder="outputs"):
+    cleanup_idle_sessions()
+    with folder_lock(output_folder):
+        return _create_story_and_images(name, age, gender, moral, scenes_count, length, photo_contents, draft,
+                                        output_folder)
+
+
+def _create_story_and_images(name, age, gender, moral, scenes_count, length, photo_contents, draft, output_folder):
+    prepare_output_folder(output_folder)
     story_scenes = generate_story_from_llama3(name, age, moral, scenes_count, length)
     story_text = ""
     image_divs = []
@@ -23,14 +101,52 @@ def create_story_and_images(name, age, gender, moral, scenes_count, length, phot
     # img_src = display_image(img_path)
     # image_divs.append({"src": img_src, "title": "Character Scene"})    
 
+    manifest = []
     for i, sc in enumerate(story_scenes):
         title = sc.get("title", f"Scene {i+1}")
         text = sc.get("text", "")
         scene_desc = sc.get("background", "cartoon storybook scene, light pastel colors, soft, calm")
 
         story_text += f"\n🧩 {title}\n{text}\n"
-        img_path = generate_scene(scene_desc, age, gender, i+1)
+        seed = random.randrange(2**32)
+        img_path = generate_scene(scene_desc, age, gender, i+1, output_folder, draft=draft, seed=seed)
         img_src = display_image(img_path)
-        image_divs.append({"src": img_src, "title": title})
+        image_divs.append({"src": img_src, "title": title, "quality": "draft" if draft else "final"})
+        manifest.append({"index": i+1, "title": title, "background": scene_desc, "age": age,
+                         "gender": gender, "seed": seed, "quality": "draft" if draft else "final"})
 
+    save_scene_manifest(manifest, output_folder)
     return story_text, image_divs
+
+
+def finalize_scenes(scene_indices=None, output_folder="outputs"):
+    """
+    Re-render draft scenes at full quality, reusing the seeds stored in the manifest.
+    Only the given scene numbers are refined; None refines every draft.
+    Runs under the folder's lock, so a second call waits and then skips scenes that are
+    already final. Returns image data for all scenes.
+    """
+    with folder_lock(output_folder):
+        return _finalize_scenes(scene_indices, output_folder)
+
+
+def _finalize_scenes(scene_indices, output_folder):
+    manifest = load_scene_manifest(output_folder)
+    for sc in manifest:
+        if sc["quality"] == "draft" and (scene_indices is None or sc["index"] in scene_indices):
+            refine_scene(sc["background"], sc["age"], sc["gender"], sc["index"], sc["seed"], output_folder)
+            sc["quality"] = "final"
+            save_scene_manifest(manifest, output_folder)
+    return scene_image_data(manifest, output_folder)
+
+
+def finalize_and_export(story_text, scene_count, output_folder="outputs"):
+    """
+    Refine every remaining draft and build the PDF while holding the folder's lock,
+    so a Generate click in the same session can't archive the scenes mid-export.
+    """
+    with folder_lock(output_folder):
+        if not story_text or not load_scene_manifest(output_folder):
+            return "Please generate a story before exporting!"
+        _finalize_scenes(None, output_folder)
+        return export_story_to_pdf(story_text, scene_count, output_folder=output_folder)
@@ -1,4 +1,5 @@
 import json, requests
+from stub_backends import USE_STUB_BACKENDS, stub_llama3_response
 
 def generate_story_from_llama3(name, age, moral, scenes, length):
     """Generate story JSON using local Llama3 API."""
@@ -9,16 +10,19 @@ def generate_story_from_llama3(name, age, moral, scenes, length):
     )
     print("Llama3 prompt:", system_prompt)
 
-    try:
-        resp = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "llama3", "prompt": system_prompt, "stream": False},
-            timeout=300
-        )
-        text = resp.json().get("response", "")
-    except requests.exceptions.RequestException as e:
-        print("Llama3 API request failed:", e)
-        text = ""
+    if USE_STUB_BACKENDS:
+        text = stub_llama3_response(name, moral, scenes)
+    else:
+        try:
+            resp = requests.post(
+                "http://localhost:11434/api/generate",
+                json={"model": "llama3", "prompt": system_prompt, "stream": False},
+                timeout=300
+            )
+            text = resp.json().get("response", "")
+        except requests.exceptions.RequestException as e:
+            print("Llama3 API request failed:", e)
+            text = ""
 
     # Parse story structure
     try:
@@ -0,0 +1,48 @@
+import os
+import json
+import time
+import random
+from types import SimpleNamespace
+from PIL import Image
+
+# Set KIDS_STORY_STUB_BACKENDS=1 to run the app without Llama3 or Stable Diffusion,
+# e.g. when load testing the Dash callbacks with load_test.py.
+USE_STUB_BACKENDS = os.environ.get("KIDS_STORY_STUB_BACKENDS", "0") == "1"
+
+# Simulated latency in seconds for each backend call.
+STUB_LLM_LATENCY = float(os.environ.get("STUB_LLM_LATENCY", "2.0"))
+STUB_DIFFUSION_LATENCY = float(os.environ.get("STUB_DIFFUSION_LATENCY", "5.0"))
+
+PASTEL_COLORS = [(255, 223, 211), (204, 236, 239), (255, 250, 205), (221, 204, 255), (204, 255, 204)]
+
+
+def stub_llama3_response(name, moral, scenes):
+    """Return a Llama3-style JSON story after sleeping for STUB_LLM_LATENCY seconds."""
+    time.sleep(STUB_LLM_LATENCY)
+    story = {"scenes": [
+        {
+            "title": f"Scene {i}",
+            "text": f"{name} learns a little more about {moral or 'kindness'} today.",
+            "background": f"sunny meadow with friendly animals, scene {i}"
+        }
+        for i in range(1, int(scenes or 1) + 1)
+    ]}
+    return json.dumps(story)
+
+
+class StubDiffusionPipeline:
+    """
+    Stands in for a diffusers pipeline: sleeps for STUB_DIFFUSION_LATENCY seconds per
+    full 512x512, 50-step render (scaled by size, steps and img2img strength)
+    and returns a plain pastel image of the requested size.
+    """
+
+    def __call__(self, prompt, image=None, height=512, width=512, num_inference_steps=50,
+                 strength=0.8, **kwargs):
+        if image is not None:
+            width, height = image.size
+        else:
+            strength = 1.0
+        cost = (width * height) / (512 * 512) * (num_inference_steps / 50) * strength
+        time.sleep(STUB_DIFFUSION_LATENCY * cost)
+        return SimpleNamespace(images=[Image.new("RGB", (width, height), random.choice(PASTEL_COLORS))])
@@ -1,6 +1,8 @@
 from datetime import datetime
 import os
 import io
+import json
+import uuid
 import base64
 import shutil
 from PIL import Image
@@ -47,6 +49,44 @@ def prepare_output_folder(base_folder="outputs"):
     print(f"✅ Output folder ready: {base_folder}")
     return base_folder
 
+def session_folder(session_id, base_folder="outputs"):
+    """
+    Output folder for one browser session, so families using the app at the same
+    time don't archive or overwrite each other's scenes. Falls back to base_folder
+    when there is no valid session id.
+    """
+    try:
+        return os.path.join(base_folder, uuid.UUID(str(session_id)).hex)
+    except ValueError:
+        return base_folder
+
+
+def is_session_folder(path):
+    """True for folders created by session_folder (named by a session id)."""
+    try:
+        return uuid.UUID(os.path.basename(path)).hex == os.path.basename(path)
+    except ValueError:
+        return False
+
+
+def save_scene_manifest(scenes, base_folder="outputs"):
+    """
+    Save how each scene was rendered (description, seed, draft or final)
+    so kept drafts can be re-rendered at full quality later.
+    """
+    os.makedirs(base_folder, exist_ok=True)
+    with open(os.path.join(base_folder, "scenes.json"), "w") as f:
+        json.dump(scenes, f, indent=2)
+
+
+def load_scene_manifest(base_folder="outputs"):
+    """Return the scene list written by save_scene_manifest, or [] if there is none."""
+    path = os.path.join(base_folder, "scenes.json")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
 def display_image(path):
     """Convert image to base64 for Dash display."""
     if not os.path.exists(path):
@@ -81,8 +121,10 @@ def add_image_page(c, img_path, title, width, height, margin):
         img_width = width - 2 * margin
         c.drawImage(img, margin, 150, width=img_width, preserveAspectRatio=True, mask='auto')
 
-def export_story_to_pdf(story_text, scene_count, output_path="outputs/storybook.pdf"):
-    """Export story text and scene images to a colorful kids-friendly PDF."""
+def export_story_to_pdf(story_text, scene_count, output_path=None, output_folder="outputs"):
+    """Export story text and scene images from output_folder to a colorful kids-friendly PDF."""
+    if output_path is None:
+        output_path = os.path.join(output_folder, "storybook.pdf")
     c = canvas.Canvas(output_path, pagesize=A4)
     width, height = A4
 
@@ -140,11 +182,11 @@ def export_story_to_pdf(story_text, scene_count, output_path="outputs/storybook.
 
     # Add scene images
     # Add initial character image
-    add_image_page(c, "character_scene.png", "Character Introduction", width, height, margin)
+    add_image_page(c, os.path.join(output_folder, "character_scene.png"), "Character Introduction", width, height, margin)
 
     # Add scene images
     for i in range(scene_count):
-        scene_img_path = f"outputs/scene_{i+1}.png"
+        scene_img_path = os.path.join(output_folder, f"scene_{i+1}.png")
         add_image_page(c, scene_img_path, f"Scene {i + 1}", width, height, margin)
 
     c.save()